@@ -4,16 +4,32 @@ Converts bank statement files (CSV/Excel) into Fortnox-compatible CSV format
 for bank reconciliation (Stäm av konto).
 """
 
+import copy
+import csv
+import functools
+import io
 import os
 from datetime import date
 
+import numpy as np
 import pandas as pd
 import yaml
 import streamlit as st
 from streamlit_sortables import sort_items
 
 from riksbanken import get_available_currencies, get_fx_rate
-from converter import transform_data, export_csv
+from converter import transform_data, export_csv, parse_dates
+
+try:
+    from yaml import CSafeLoader as _YamlLoader, CSafeDumper as _YamlDumper
+except ImportError:
+    from yaml import SafeLoader as _YamlLoader, SafeDumper as _YamlDumper
+
+try:
+    import pyarrow  # noqa: F401
+    CSV_DTYPE = "string[pyarrow]"
+except ImportError:
+    CSV_DTYPE = str
 
 PRESETS_PATH = os.path.join(os.path.dirname(__file__), "presets.yaml")
 FORTNOX_FIELDS = ["Datum", "Beskrivning", "Belopp"]
@@ -24,18 +40,136 @@ DISPLAY_NAMES = {"Datum": "Date", "Beskrivning": "Description", "Belopp": "Amoun
 
 # ── Preset helpers ──────────────────────────────────────────────────────────
 
+@functools.lru_cache(maxsize=1)
+def _read_presets_file(mtime: float) -> list[dict]:
+    """Parse presets.yaml; cached per file mtime so reruns skip the YAML load."""
+    with open(PRESETS_PATH, "r", encoding="utf-8") as f:
+        data = yaml.load(f, Loader=_YamlLoader) or {}
+    return data.get("presets", [])
+
+
 def _load_presets() -> list[dict]:
     try:
-        with open(PRESETS_PATH, "r", encoding="utf-8") as f:
-            data = yaml.safe_load(f) or {}
-        return data.get("presets", [])
+        return copy.deepcopy(_read_presets_file(os.path.getmtime(PRESETS_PATH)))
     except FileNotFoundError:
         return []
 
 
 def _save_presets(presets: list[dict]) -> None:
     with open(PRESETS_PATH, "w", encoding="utf-8") as f:
-        yaml.dump({"presets": presets}, f, allow_unicode=True, default_flow_style=False)
+        yaml.dump({"presets": presets}, f, Dumper=_YamlDumper, allow_unicode=True, default_flow_style=False)
+
+
+# ── Upload helpers ──────────────────────────────────────────────────────────
+
+@st.cache_data(show_spinner=False, max_entries=4)
+def _parse_upload(name: str, data: bytes) -> pd.DataFrame:
+    """Read an uploaded CSV/Excel file into a DataFrame.
+
+    Cached on file name and content, so widget reruns don't re-parse the upload.
+    """
+    if name.endswith((".xlsx", ".xls")):
+        try:
+            return pd.read_excel(io.BytesIO(data), engine="calamine")
+        except (ImportError, ValueError):
+            # python-calamine not installed (or pandas too old for it)
+            return pd.read_excel(io.BytesIO(data))
+
+    buf = io.BytesIO(data)
+    # Sniffing and header detection only look at the start of the file
+    sample = data[:65536].decode("utf-8", errors="replace")
+    lines = sample.splitlines()
+
+    def _find_header_row(lines, sep):
+        """Return the index of the row with the most columns (the real header)."""
+        col_counts = []
+        for line in lines:
+            if not line.strip():
+                col_counts.append(0)
+                continue
+            try:
+                row = next(csv.reader([line], delimiter=sep))
+                col_counts.append(len(row))
+            except Exception:
+                col_counts.append(0)
+        if not col_counts:
+            return 0
+        max_cols = max(col_counts)
+        return next((i for i, c in enumerate(col_counts) if c == max_cols), 0)
+
+    def _read_csv(sep, engine):
+        buf.seek(0)
+        candidate = pd.read_csv(
+            buf,
+            sep=sep,
+            skiprows=_find_header_row(lines, sep),
+            dtype=CSV_DTYPE,
+            encoding="utf-8",
+            encoding_errors="replace",
+            engine=engine,
+            on_bad_lines="skip",
+        )
+        # Drop rows that are entirely empty (blank lines after header)
+        candidate.dropna(how="all", inplace=True)
+        return candidate
+
+    # Sniff the delimiter from the start of the file and parse once
+    best_df = None
+    try:
+        sep = csv.Sniffer().sniff(sample, delimiters=";,\t").delimiter
+        candidate = _read_csv(sep, engine="c")
+        if len(candidate.columns) > 1:
+            best_df = candidate
+    except Exception:
+        pass
+
+    # Sniffing failed: try common CSV delimiters, use python engine for robustness
+    if best_df is None:
+        for sep in [";", ",", "\t"]:
+            try:
+                candidate = _read_csv(sep, engine="python")
+                if best_df is None or len(candidate.columns) > len(best_df.columns):
+                    best_df = candidate
+                if len(candidate.columns) > 1:
+                    break
+            except Exception:
+                continue
+    if best_df is None:
+        raise ValueError("Could not parse CSV with any common delimiter.")
+    return best_df
+
+
+@st.cache_data(show_spinner=False, max_entries=16)
+def _max_date(dates: pd.Series) -> date:
+    """Latest date in a raw date column; cached so reruns skip the datetime parse."""
+    return parse_dates(dates).max().date()
+
+
+@st.cache_data(show_spinner=False, max_entries=16)
+def _transform(
+    upload_id: str,
+    mapping_items: tuple[tuple[str, str], ...],
+    fx_rate: float | None,
+    _df: pd.DataFrame,
+) -> pd.DataFrame:
+    """transform_data, cached per upload, mapping and rate.
+
+    _df is left out of the cache key (leading underscore); upload_id identifies it.
+    """
+    return transform_data(_df, dict(mapping_items), fx_rate)
+
+
+@st.cache_data(show_spinner=False, max_entries=4)
+def _export(
+    upload_id: str,
+    mapping_items: tuple[tuple[str, str], ...],
+    fx_rate: float | None,
+    date_from: date,
+    date_to: date,
+    _df: pd.DataFrame,
+) -> bytes:
+    """export_csv of the filtered rows, cached on the inputs that produced them."""
+    return export_csv(_df)
 
 
 # ── Page config ─────────────────────────────────────────────────────────────
@@ -58,55 +192,7 @@ if uploaded_file is None:
 
 # Read file into DataFrame
 try:
-    if uploaded_file.name.endswith((".xlsx", ".xls")):
-        df = pd.read_excel(uploaded_file)
-    else:
-        # Try common CSV delimiters, use python engine for robustness
-        content = uploaded_file.getvalue().decode("utf-8", errors="replace")
-        lines = content.splitlines()
-
-        def _find_header_row(lines, sep):
-            """Return the index of the row with the most columns (the real header)."""
-            import csv as _csv
-            col_counts = []
-            for line in lines:
-                if not line.strip():
-                    col_counts.append(0)
-                    continue
-                try:
-                    row = next(_csv.reader([line], delimiter=sep))
-                    col_counts.append(len(row))
-                except Exception:
-                    col_counts.append(0)
-            if not col_counts:
-                return 0
-            max_cols = max(col_counts)
-            return next((i for i, c in enumerate(col_counts) if c == max_cols), 0)
-
-        best_df = None
-        for sep in [";", ",", "\t"]:
-            try:
-                skiprows = _find_header_row(lines, sep)
-                candidate = pd.read_csv(
-                    pd.io.common.StringIO(content),
-                    sep=sep,
-                    skiprows=skiprows,
-                    dtype=str,
-                    engine="python",
-                    on_bad_lines="skip",
-                )
-                # Drop rows that are entirely empty (blank lines after header)
-                candidate.dropna(how="all", inplace=True)
-                if best_df is None or len(candidate.columns) > len(best_df.columns):
-                    best_df = candidate
-                if len(candidate.columns) > 1:
-                    break
-            except Exception:
-                continue
-        if best_df is not None:
-            df = best_df
-        else:
-            raise ValueError("Could not parse CSV with any common delimiter.")
+    df = _parse_upload(uploaded_file.name, uploaded_file.getvalue())
 except Exception as e:
     st.error(f"Could not read file: {e}")
     st.stop()
@@ -203,7 +289,7 @@ if not mapping_complete:
 
 # Determine default reference date from the mapped date column
 try:
-    file_max_date = pd.to_datetime(df[mapping["Datum"]], dayfirst=True).max().date()
+    file_max_date = _max_date(df[mapping["Datum"]])
 except Exception:
     file_max_date = date.today()
 
@@ -250,13 +336,16 @@ if currency != "SEK":
 # ── Step 4: Transform, filter & preview ──────────────────────────────────────
 
 try:
-    result_df = transform_data(df, mapping, fx_rate)
+    mapping_items = tuple(sorted(mapping.items()))
+    result_df = _transform(uploaded_file.file_id, mapping_items, fx_rate, df)
 
     # Date range filter
     st.subheader("Date filter")
-    dates = pd.to_datetime(result_df["Datum"])
-    min_date = dates.min().date()
-    max_date = dates.max().date()
+    # Datum is ISO YYYY-MM-DD text, which NumPy parses straight to day precision
+    dates = result_df["Datum"].to_numpy().astype("datetime64[D]")
+    valid_dates = dates[~np.isnat(dates)]
+    min_date = valid_dates.min().item()
+    max_date = valid_dates.max().item()
 
     col_from, col_to = st.columns(2)
     with col_from:
@@ -265,14 +354,14 @@ try:
         date_to = st.date_input("To date", value=max_date, min_value=min_date, max_value=max_date)
 
     # Apply filter
-    mask = (dates >= pd.Timestamp(date_from)) & (dates <= pd.Timestamp(date_to))
+    mask = (dates >= np.datetime64(date_from)) & (dates <= np.datetime64(date_to))
     filtered_df = result_df[mask].reset_index(drop=True)
 
     st.subheader(f"Output preview ({len(filtered_df)} rows)")
     st.dataframe(filtered_df.head(20), use_container_width=True)
 
     # ── Step 5: Export ──────────────────────────────────────────────────
-    csv_bytes = export_csv(filtered_df)
+    csv_bytes = _export(uploaded_file.file_id, mapping_items, fx_rate, date_from, date_to, filtered_df)
     preset_label = selected_preset.split(" - ")[0].strip() if selected_preset != "(No preset)" else "Custom"
     file_name = f"{preset_label}-{currency}-{date_from.isoformat()}-{date_to.isoformat()}.csv"
 
@@ -1,21 +1,93 @@
 """Data transformation and Fortnox CSV export."""
 
+import csv
 import io
+import re
+from collections.abc import Iterator
+import numpy as np
 import pandas as pd
 
 
+EXPORT_CHUNK_ROWS = 10_000
+
+# Single-pass cleanup table for numeric strings
+_NUM_TRANS = str.maketrans({
+    "\u2212": "-",   # Unicode minus → hyphen-minus
+    "\u2013": "-",   # en-dash → hyphen-minus
+    "\xa0": None,    # non-breaking space
+    " ": None,       # regular space
+    ",": ".",        # Swedish decimal -> Python float
+})
+
+
+# Any ISO 8601 date or timestamp (2024-1-5, 2024-01-05T10:00:00.123+01:00, ...)
+_ISO_DATE = re.compile(r"\d{4}-\d{1,2}-\d{1,2}")
+# Other common uniform date formats in bank exports, checked against the first value
+_DATE_FORMATS = [
+    (re.compile(r"\d{2}/\d{2}/\d{4}"), "%d/%m/%Y"),
+    (re.compile(r"\d{2}\.\d{2}\.\d{4}"), "%d.%m.%Y"),
+    (re.compile(r"\d{2}-\d{2}-\d{4}"), "%d-%m-%Y"),
+]
+
+
+def parse_dates(series: pd.Series) -> pd.Series:
+    """Parse a date column, using an explicit format when the first value matches a known one.
+
+    ISO 8601 values (with or without a time part) are always read year-month-day.
+    Falls back to per-value format inference if the column is not uniform.
+    """
+    non_null = series.dropna()
+    if len(non_null):
+        first = str(non_null.iloc[0]).strip()
+        if _ISO_DATE.match(first):
+            fmt = "ISO8601"
+        else:
+            fmt = next((f for pattern, f in _DATE_FORMATS if pattern.fullmatch(first)), None)
+        if fmt:
+            try:
+                return pd.to_datetime(series, format=fmt)
+            except ValueError:
+                pass
+    return pd.to_datetime(series, dayfirst=True, format="mixed")
+
+
+def _as_text(series: pd.Series) -> pd.Series:
+    """Return series as a pandas string dtype, keeping existing ones (e.g. string[pyarrow]) as-is."""
+    if isinstance(series.dtype, pd.StringDtype):
+        return series
+    return series.astype("string")
+
+
 def _parse_numeric(series: pd.Series) -> pd.Series:
     """Parse a string series into numeric, handling Unicode minus, Swedish decimals, etc."""
     return pd.to_numeric(
-        series
-        .astype(str)
-        .str.replace("\u2212", "-", regex=False)  # Unicode minus → hyphen-minus
-        .str.replace("\u2013", "-", regex=False)  # en-dash → hyphen-minus
-        .str.replace("\xa0", "", regex=False)     # non-breaking space
-        .str.replace(" ", "", regex=False)        # regular space
-        .str.replace(",", ".", regex=False),      # Swedish decimal -> Python float
+        _as_text(series).str.translate(_NUM_TRANS),
         errors="coerce",
-    )
+    ).astype("float64")  # string dtypes parse to nullable Float64
+
+
+def _format_belopp(series: pd.Series) -> np.ndarray:
+    """Format amounts as Swedish decimal strings with two decimals, e.g. -1234,50.
+
+    Rounds via integer öre in NumPy. Values whose öre product lands exactly on
+    a half (where that rounding can differ from the true decimal value),
+    values too large to count in exact öre, and non-finite values are
+    formatted one by one as before.
+    """
+    values = series.to_numpy(dtype=np.float64, na_value=np.nan)
+    with np.errstate(invalid="ignore"):
+        fast = np.abs(values) < 1e13  # öre stay exact in float64 below 2**53
+    scaled = np.where(fast, values, 0) * 100
+    cents = np.rint(scaled).astype(np.int64)
+    sign = np.where(cents < 0, "-", "")
+    cents = np.abs(cents)
+    whole = (cents // 100).astype(str)
+    frac = np.char.add((cents // 10 % 10).astype(str), (cents % 10).astype(str))
+    out = np.char.add(np.char.add(sign, whole), np.char.add(",", frac)).astype(object)
+
+    slow = ~fast | (scaled - np.floor(scaled) == 0.5)
+    out[slow] = [f"{v:.2f}".replace(".", ",") for v in values[slow]]
+    return out
 
 
 def transform_data(
@@ -36,12 +108,15 @@ def transform_data(
         DataFrame with columns [Datum, Beskrivning, Belopp].
         Belopp = (amount - fee) * fx_rate
     """
-    result = pd.DataFrame()
+    # Keep the source index so every column lines up by row, gaps included
+    result = pd.DataFrame(index=df.index)
 
-    result["Datum"] = pd.to_datetime(
-        df[mapping["Datum"]], dayfirst=True, format="mixed"
-    ).dt.strftime("%Y-%m-%d")
-    result["Beskrivning"] = df[mapping["Beskrivning"]].astype(str).str.strip()
+    dt = parse_dates(df[mapping["Datum"]])
+    if dt.dt.tz is not None:
+        dt = dt.dt.tz_localize(None)  # keep the local wall-clock date
+    # Day precision formats as ISO YYYY-MM-DD in a single NumPy cast
+    result["Datum"] = dt.to_numpy(dtype="datetime64[D]").astype("U10")
+    result["Beskrivning"] = _as_text(df[mapping["Beskrivning"]]).str.strip().fillna("")
 
     belopp = _parse_numeric(df[mapping["Belopp"]])
 
@@ -57,21 +132,54 @@ def transform_data(
     return result
 
 
+def _fortnox_rows(df: pd.DataFrame) -> pd.DataFrame:
+    """Format [Datum, Beskrivning, Belopp] rows as the string columns Fortnox expects."""
+    datum = df["Datum"].astype(str)
+    # Stays in the column's string dtype, so this runs in Arrow kernels for string[pyarrow]
+    beskrivning = (
+        _as_text(df["Beskrivning"])
+        .fillna("")
+        .str.replace(";", ",", regex=False)      # escape semicolons
+        .str.replace(r"[\r\n]+", " ", regex=True)  # keep one row per line
+        .str.slice(0, 100)                       # max 100 chars
+    )
+
+    return pd.DataFrame({
+        "Datum": datum.to_numpy(dtype=str),
+        "Ingående saldo-Beskrivning": beskrivning.to_numpy(dtype=str),
+        "Belopp": _format_belopp(df["Belopp"]),
+    })
+
+
+def iter_csv_chunks(df: pd.DataFrame, chunk_rows: int = EXPORT_CHUNK_ROWS) -> Iterator[bytes]:
+    """Yield the Fortnox CSV export as encoded chunks of at most chunk_rows rows.
+
+    Yields the BOM and header first and the trailer line last.
+    """
+    yield b"\xef\xbb\xbf" + "Datum;Ingående saldo-Beskrivning;Belopp\r\n".encode("utf-8")
+    for start in range(0, len(df), chunk_rows):
+        out = io.BytesIO()
+        _fortnox_rows(df.iloc[start:start + chunk_rows]).to_csv(
+            out,
+            sep=";",
+            index=False,
+            header=False,
+            lineterminator="\r\n",
+            encoding="utf-8",
+            quoting=csv.QUOTE_NONE,
+        )
+        yield out.getvalue()
+    yield b"This will not be imported\r\n"
+
+
 def export_csv(df: pd.DataFrame) -> bytes:
     """Export DataFrame as Fortnox-compatible CSV bytes.
 
     Format: semicolon-separated, Swedish decimals (comma),
     UTF-8 with BOM, Windows line endings (CRLF).
     """
-    lines = ["Datum;Ingående saldo-Beskrivning;Belopp"]
-
-    for _, row in df.iterrows():
-        datum = row["Datum"]
-        beskrivning = str(row["Beskrivning"]).replace(";", ",")[:100]  # escape semicolons, max 100 chars
-        belopp = f"{row['Belopp']:.2f}".replace(".", ",")
-        lines.append(f"{datum};{beskrivning};{belopp}")
-
-    lines.append("This will not be imported")
-
-    content = "\r\n".join(lines) + "\r\n"
-    return b"\xef\xbb\xbf" + content.encode("utf-8")
+    # Chunks are copied into one growing buffer and released as we go, so
+    # peak memory is the output plus a single chunk
+    out = io.BytesIO()
+    out.writelines(iter_csv_chunks(df))
+    return out.getvalue()
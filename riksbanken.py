@@ -1,11 +1,42 @@
 """Riksbanken SWEA API client for fetching FX rates."""
 
+import json
+import os
+import time
 from datetime import date, timedelta
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import streamlit as st
 
 BASE_URL = "https://api.riksbank.se/swea/v1"
 
+# Second-tier cache for raw observations, survives server restarts
+DISK_CACHE_DIR = os.path.join(os.path.dirname(__file__), ".fx_cache")
+DISK_CACHE_TTL = 7 * 24 * 3600  # seconds
+# Only persist windows old enough that Riksbanken has published every rate in them
+DISK_CACHE_MIN_AGE = timedelta(days=15)
+
+REQUEST_TIMEOUT = (3, 10)  # (connect, read) seconds
+# Failed lookups are remembered this long so a down API is not retried on every rerun
+FAILED_LOOKUP_TTL = 300  # seconds
+
+# Shared session so repeated lookups reuse the HTTPS connection.
+# Only connection failures and error statuses are retried, never a read that
+# timed out, and Retry-After is ignored so a lookup stays within a few seconds.
+_SESSION = requests.Session()
+_SESSION.mount(
+    "https://",
+    HTTPAdapter(max_retries=Retry(
+        total=3,
+        connect=1,
+        read=0,
+        backoff_factor=0.3,
+        status_forcelist=[429, 500, 502, 503, 504],
+        respect_retry_after_header=False,
+    )),
+)
+
 CURRENCY_SERIES = {
     "EUR": "SEKEURPMI",
     "USD": "SEKUSDPMI",
@@ -36,9 +67,8 @@ def get_available_currencies() -> list[str]:
 
 def _last_business_day(d: date) -> date:
     """Find the last business day on or before the given date."""
-    while d.weekday() >= 5:  # Saturday=5, Sunday=6
-        d -= timedelta(days=1)
-    return d
+    # Saturday=5, Sunday=6 step back 1 and 2 days respectively
+    return d - timedelta(days=max(0, d.weekday() - 4))
 
 
 def _previous_month_end(reference_date: date) -> date:
@@ -47,47 +77,99 @@ def _previous_month_end(reference_date: date) -> date:
     return first_of_month - timedelta(days=1)
 
 
+def _fetch_observations(series_id: str, query_from_iso: str) -> list | None:
+    """Fetch raw observations for a series from the given date onward.
+
+    Responses are cached on disk under DISK_CACHE_DIR for DISK_CACHE_TTL.
+    Returns None if the API does not answer with 200.
+    """
+    cache_path = os.path.join(DISK_CACHE_DIR, f"{series_id}_{query_from_iso}.json")
+    try:
+        if time.time() - os.path.getmtime(cache_path) < DISK_CACHE_TTL:
+            with open(cache_path, "r", encoding="utf-8") as f:
+                return json.load(f)
+    except (OSError, ValueError):
+        pass
+
+    url = f"{BASE_URL}/Observations/{series_id}/{query_from_iso}"
+    resp = _SESSION.get(url, timeout=REQUEST_TIMEOUT)
+    if resp.status_code != 200:
+        return None
+    data = resp.json()
+
+    if data and isinstance(data, list) and (
+        date.fromisoformat(query_from_iso) <= date.today() - DISK_CACHE_MIN_AGE
+    ):
+        try:
+            os.makedirs(DISK_CACHE_DIR, exist_ok=True)
+            with open(cache_path, "w", encoding="utf-8") as f:
+                json.dump(data, f)
+        except OSError:
+            pass
+    return data
+
+
 @st.cache_data(ttl=3600, show_spinner=False)
-def get_fx_rate(currency: str, reference_date: date) -> tuple[float | None, date | None]:
-    """Fetch the closing FX rate from Riksbanken for the end of the previous month.
+def _month_end_rate(series_id: str, month_end: date) -> tuple[float, date]:
+    """Look up the last rate on or before month_end for one series.
 
     The API returns rates starting FROM the query date forward, so we query
     from a few days before month-end and pick the last rate on or before
     the actual month-end date.
 
+    Raises instead of returning on failure, so st.cache_data only keeps
+    successful lookups: LookupError if no rate was found, and
+    requests.RequestException if the API could not be reached.
+    """
+    # Query from 10 days before month-end to ensure we capture the last trading day
+    query_from = month_end - timedelta(days=10)
+
+    data = _fetch_observations(series_id, query_from.isoformat())
+    try:
+        if isinstance(data, list) and len(data) > 0:
+            # Find the last observation on or before month-end
+            best = None
+            for obs in data:
+                obs_date = date.fromisoformat(obs["date"])
+                if obs_date <= month_end:
+                    best = obs
+                else:
+                    break  # dates are sorted ascending, no need to continue
+            if best:
+                return float(best["value"]), date.fromisoformat(best["date"])
+    except (ValueError, KeyError):
+        pass
+    raise LookupError(f"No rate for {series_id} on or before {month_end}")
+
+
+@st.cache_data(ttl=FAILED_LOOKUP_TTL, show_spinner=False)
+def _lookup_rate(series_id: str, month_end: date) -> tuple[float, date] | None:
+    """Wrap _month_end_rate so failures are cached too, but only briefly.
+
+    Successful lookups are served from _month_end_rate's own cache once this
+    entry expires, so only failures are retried against the API.
+    """
+    try:
+        return _month_end_rate(series_id, month_end)
+    except (LookupError, requests.RequestException):
+        return None
+
+
+def get_fx_rate(currency: str, reference_date: date) -> tuple[float | None, date | None]:
+    """Fetch the closing FX rate from Riksbanken for the end of the previous month.
+
+    Lookups are cached per series and month-end, so any reference date in the
+    same month reuses them.
+
     Args:
-        currency: Currency code (e.g. "EUR", "USD")
-        reference_date: The transaction date — rate will be fetched for
+        currency: Currency code (e.g. "EUR").
+        reference_date: The transaction date — the rate is fetched for
                         the last available rate of the previous month.
 
     Returns:
-        Tuple of (rate, rate_date) or (None, None) on failure.
+        (rate, rate_date), or (None, None) if the rate is unavailable.
     """
     series_id = CURRENCY_SERIES.get(currency.upper())
     if not series_id:
         return None, None
-
-    month_end = _previous_month_end(reference_date)
-    # Query from 10 days before month-end to ensure we capture the last trading day
-    query_from = month_end - timedelta(days=10)
-
-    url = f"{BASE_URL}/Observations/{series_id}/{query_from.isoformat()}"
-    try:
-        resp = requests.get(url, timeout=10)
-        if resp.status_code == 200:
-            data = resp.json()
-            if isinstance(data, list) and len(data) > 0:
-                # Find the last observation on or before month-end
-                best = None
-                for obs in data:
-                    obs_date = date.fromisoformat(obs["date"])
-                    if obs_date <= month_end:
-                        best = obs
-                    else:
-                        break  # dates are sorted ascending, no need to continue
-                if best:
-                    return float(best["value"]), date.fromisoformat(best["date"])
-    except (requests.RequestException, ValueError, KeyError):
-        pass
-
-    return None, None
+    return _lookup_rate(series_id, _previous_month_end(reference_date)) or (None, None)